@@ -0,0 +1,108 @@
+'''
+Numba-compiled inner loops for the engine.
+
+numba is an optional dependency. If it can't be imported, NUMBA_AVAILABLE is False
+and callers are expected to fall back to their pure Python implementations.
+'''
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+@njit(cache=True)
+def _xorshift64(state):
+    state ^= state << np.uint64(13)
+    state ^= state >> np.uint64(7)
+    state ^= state << np.uint64(17)
+    return state
+
+@njit(cache=True)
+def mc_rollouts(numbers, max_mc_steps, seed):
+    '''
+    Monte Carlo random walks through the numbers reachable from `numbers`, drawn from
+    the same distribution as the walks CountleEngine.generate_target samples in Python.
+    They use their own xorshift64 generator, though, so a seed gives different walks
+    here than it does there.
+
+    Each rollout applies n - 1 uniformly chosen valid operations, with commutative
+    operations only counted once per pair like in get_valid_moves. Operations are encoded
+    inline (no Operation objects), and since only the multiset matters, an operation
+    writes its result over one operand and moves the last live number into the other.
+
+    Args:
+        numbers: int64 array of starting numbers
+        max_mc_steps: Number of rollouts
+        seed: Nonzero xorshift64 seed
+
+    Returns:
+        (results, steps) int64 arrays, holding every result produced
+        and the step of its rollout it was produced at (1-indexed)
+    '''
+    n = numbers.shape[0]
+    temp = np.empty(n, np.int64)
+    # (i, j, result) of every valid move from the current numbers
+    moves = np.empty((n * (n - 1) * 4, 3), np.int64)
+    results = np.empty(max_mc_steps * (n - 1), np.int64)
+    steps = np.empty(max_mc_steps * (n - 1), np.int64)
+    state = np.uint64(seed)
+    count = 0
+
+    for _ in range(max_mc_steps):
+        temp[:] = numbers
+        size = n
+
+        for step in range(n - 1):
+            num_moves = 0
+            for i in range(size):
+                for j in range(size):
+                    if i == j:
+                        continue
+                    a = temp[i]
+                    b = temp[j]
+
+                    # ADD
+                    if i < j:
+                        moves[num_moves, 0] = i
+                        moves[num_moves, 1] = j
+                        moves[num_moves, 2] = a + b
+                        num_moves += 1
+                    # SUBTRACT
+                    if a >= b:
+                        moves[num_moves, 0] = i
+                        moves[num_moves, 1] = j
+                        moves[num_moves, 2] = a - b
+                        num_moves += 1
+                    # MULTIPLY
+                    if i < j:
+                        moves[num_moves, 0] = i
+                        moves[num_moves, 1] = j
+                        moves[num_moves, 2] = a * b
+                        num_moves += 1
+                    # DIVIDE
+                    if b != 0 and a % b == 0:
+                        moves[num_moves, 0] = i
+                        moves[num_moves, 1] = j
+                        moves[num_moves, 2] = a // b
+                        num_moves += 1
+
+            state = _xorshift64(state)
+            k = np.int64(state % np.uint64(num_moves))
+            i = moves[k, 0]
+            j = moves[k, 1]
+            result = moves[k, 2]
+
+            temp[i] = result
+            temp[j] = temp[size - 1]
+            size -= 1
+
+            results[count] = result
+            steps[count] = step + 1
+            count += 1
+
+    return results[:count], steps[:count]
@@ -1,11 +1,29 @@
 import re
 import random
+import bisect
 
-from typing import List, Tuple, Optional
+import numpy as np
 
-from game.state import GameState
-from game.types import MoveType, Operation
+from typing import Dict, List, Sequence, Tuple, Optional, Union
+
+from game.state import GameState, HistoryNode, fits_int64, lane_bits_for, number_array, pack_numbers
+from game.types import MoveType, Operation, OP_FUNCS, SYMBOL_TO_OPERATION
 from game.move import GameMove
+from game._kernels import NUMBA_AVAILABLE, mc_rollouts
+
+_OP_RE = Operation.operation_regex()
+
+# Operations by index, so move generation doesn't iterate the enum each time
+_OPERATIONS = tuple(Operation)
+
+# Operation functions to try on a pair, depending on whether its operands are in
+# index order: all of OP_FUNCS, or just these. Commutative operations only need
+# one of the two orderings.
+_SWAPPED_PAIR_FUNCS = (Operation.SUBTRACT.func, Operation.DIVIDE.func)
+
+# Step count of numbers not reached yet, larger than any real one.
+# Saves building float('inf') on every closure update.
+_UNREACHED = 1 << 30
 
 class CountleEngine:
     '''
@@ -17,6 +35,9 @@ class CountleEngine:
     The abstraction is probably not very good, but it will do for now.
     '''
     ROLLBACK_REGEX = r'^(?:rb|rollback)\s+(\d+)$'
+    # Largest num_numbers for which generate_target enumerates the closure exactly
+    EXACT_CLOSURE_MAX_N = 6
+    _ROLLBACK_RE = re.compile(ROLLBACK_REGEX, re.IGNORECASE)
     
     def __init__(self, 
         num_numbers: int, 
@@ -44,12 +65,23 @@ class CountleEngine:
         self.total_reward = 0
         self.won = False
         self.move_count = 0
+        # is_terminal, refreshed by _update_terminal whenever the state changes
+        self._terminal_cached = False
 
         self.seed = seed
         self.rng = random.Random(seed)
+
+        # Lane width for packed state keys. Every result r of a and b satisfies
+        # r + 1 <= (a + 1) * (b + 1), so no state reachable from n numbers
+        # of at most max_number holds a number that overflows its lane.
+        self._lane_bits = self.n * (self.max_number + 1).bit_length()
+        self._lane_limit = (1 << self._lane_bits) - 1
+
+        # Packed state key -> valid OPERATION moves, see _operation_moves
+        self._moves_cache = {}
         
     @property
-    def current_numbers(self) -> List[int]:
+    def current_numbers(self) -> np.ndarray:
         """Get current available numbers."""
         return self._internal_state.numbers
     
@@ -61,20 +93,33 @@ class CountleEngine:
     @property
     def is_terminal(self) -> bool:
         """Check if game is in terminal state."""
-        return self.won or len(self.current_numbers) == 1
+        return self._terminal_cached
+
+    def _update_terminal(self):
+        self._terminal_cached = self.won or len(self.current_numbers) == 1
     
-    def get_valid_moves(self, numbers: Optional[List[int]] = None) -> List[GameMove]:
+    def get_valid_moves(
+        self, 
+        numbers: Optional[List[int]] = None, 
+        include_rollback: bool = True
+    ) -> List[GameMove]:
         """
         Get all valid moves from current state.
         
         Args:
             numbers: Optional list of numbers to use. If None, uses current_numbers.
+            include_rollback: Whether to include ROLLBACK moves. If False, the
+                              returned list is shared with the move cache; don't mutate it.
             
         Returns:
             List of GameMove tuples
         """
-        if numbers is None:
-            numbers = self.current_numbers
+        presorted = numbers is None
+        if presorted:
+            numbers = self._internal_state.sorted_numbers
+
+        if not include_rollback:
+            return self._operation_moves(numbers, presorted = presorted)
             
         # So long as move history is not empty, there are valid moves.
         valid_moves = [
@@ -82,29 +127,69 @@ class CountleEngine:
             for i in range(1, self.n - len(numbers))
         ]
         
-        # Try all pairs of numbers
-        for i in range(len(numbers)):
-            for j in range(len(numbers)):
-                if i == j:
-                    continue
-                
-                num1, num2 = numbers[i], numbers[j]
-                
-                # Try all operations
-                for op in Operation:
-                    result = op.apply(num1, num2)
-                    # i.e. result is valid.
-                    if result is not None:
-                        valid_moves.append(
-                            GameMove(
-                                MoveType.OPERATION, 
-                                op1 = num1, 
-                                op2 = num2, 
-                                operation = op
-                            ),
-                        )
-        
-        return valid_moves
+        return valid_moves + self._operation_moves(numbers, presorted = presorted)
+    
+    def _encode(self, numbers: Sequence[int], presorted: bool = False) -> Optional[int]:
+        '''
+        Pack the multiset of numbers into an int state key.
+        Returns None if some number does not fit, i.e. the numbers aren't reachable in this game.
+        Pass presorted if numbers are already ascending Python ints, e.g. GameState.sorted_numbers.
+        '''
+        values = numbers if presorted else sorted(map(int, numbers))
+        if values and values[-1] >= self._lane_limit:
+            return None
+        return pack_numbers(values, self._lane_bits)
+
+    def _operation_moves(
+        self, 
+        numbers: Sequence[int], 
+        key: Optional[int] = None, 
+        presorted: bool = False
+    ) -> List[GameMove]:
+        '''
+        Get all valid OPERATION moves for a multiset of numbers.
+
+        Moves only depend on the values available, not their order or the game history,
+        so results are memoized on the packed state key (pass `key` if already known).
+        The returned list is shared; don't mutate it.
+        Pass presorted if numbers are already ascending Python ints.
+        '''
+        if key is None:
+            key = self._encode(numbers, presorted)
+        cached = self._moves_cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Try all ordered pairs of numbers under every operation at once.
+        # Only the validity masks are needed, since a GameMove stores operands.
+        # ADD and MULTIPLY are commutative, so only one ordering (i < j) is kept.
+        values = numbers if presorted else sorted(map(int, numbers))
+        a = number_array(values)
+        A, B = a[:, None], a[None, :]
+        off_diag = ~np.eye(len(a), dtype=bool)
+        upper = np.triu(off_diag)
+        masks = np.stack([
+            upper,                                                      # ADD
+            off_diag & (A >= B),                                        # SUBTRACT
+            upper,                                                      # MULTIPLY
+            off_diag & (B != 0) & (A % np.where(B == 0, 1, B) == 0),    # DIVIDE
+        ], axis = -1)
+
+        # argwhere yields (i, j, op) in lexicographic order, matching the
+        # order a nested loop over pairs and then operations would produce.
+        moves = [
+            GameMove(
+                MoveType.OPERATION, 
+                op1 = values[i], 
+                op2 = values[j], 
+                operation = _OPERATIONS[k]
+            )
+            for i, j, k in np.argwhere(masks).tolist()
+        ]
+
+        if key is not None:
+            self._moves_cache[key] = moves
+        return moves
     
     def execute_operation(self, num1: int, num2: int, op_symbol: str) -> Tuple[int, str]:
         """
@@ -122,21 +207,23 @@ class CountleEngine:
             return self.REWARDS['terminate'], "Game is already over!"
         
         # Step 1: Validate operands
-        try:
-            idx1 = self.current_numbers.index(num1)
-            # If num1 == num2, we need to find the second occurrence
-            if num1 == num2:
-                idx2 = self.current_numbers.index(num2, start = idx1 + 1)
-            else:
-                idx2 = self.current_numbers.index(num2)
-        except ValueError:
+        # Find both operands in a single pass. If num1 == num2, its first
+        # occurrence goes to idx1 and the second one falls through to idx2.
+        values = self.current_numbers.tolist()
+        idx1 = idx2 = -1
+        for k, v in enumerate(values):
+            if v == num1 and idx1 < 0:
+                idx1 = k
+            elif v == num2 and idx2 < 0:
+                idx2 = k
+        if idx1 < 0 or idx2 < 0:
              return (
                  self.REWARDS['invalid'], 
-                 f"Operands {num1}, {num2} not available in {self.current_numbers}"
+                 f"Operands {num1}, {num2} not available in {values}"
              )
 
         # Step 2: Lookup operation
-        operation = Operation.from_symbol(op_symbol)
+        operation = SYMBOL_TO_OPERATION.get(op_symbol)
         if operation is None:
             return (
                 self.REWARDS['invalid'],
@@ -163,29 +250,22 @@ class CountleEngine:
         reward = self.REWARDS['step']
         self.move_count += 1
         
-        # Create new numbers list
-        new_numbers = list(self.current_numbers)
-        # Remove by index to handle duplicates correctly
-        # Remove larger index first to avoid shifting
-        if idx1 > idx2:
-            new_numbers.pop(idx1)
-            new_numbers.pop(idx2)
-        else:
-            new_numbers.pop(idx2)
-            new_numbers.pop(idx1)
-            
+        # Create new numbers, removing by index to handle duplicates correctly.
+        # Built from Python ints, so a result too big for int64 isn't wrapped.
+        new_numbers = [v for k, v in enumerate(values) if k != idx1 and k != idx2]
         new_numbers.append(result)
         
         # Create new state
         move_desc = f"{num1} {op_symbol} {num2} = {result}"
         new_state = GameState(
             numbers = new_numbers, 
-            move_history = self.history + [move_desc],
+            move_history = HistoryNode(self._internal_state.move_history, move_desc),
             move_description = move_desc,
             target = self._internal_state.target,
         )
         self._internal_state = new_state
-        self.history.append(new_state)
+        self.history[self._hist_len] = new_state
+        self._hist_len += 1
         
         # Check if won
         if result == self._internal_state.target:
@@ -194,6 +274,7 @@ class CountleEngine:
             message = f"{move_desc} -> WON! (Reached {self._internal_state.target})"
         else:
             message = f"Valid Move: {move_desc}"
+        self._update_terminal()
         
         self.total_reward += reward
         return reward, message
@@ -214,16 +295,19 @@ class CountleEngine:
         if step_index < 0:
             return self.REWARDS['invalid'], "Invalid step index (must be >= 0)"
         
-        if step_index > len(self.history) - 1:
-            return self.REWARDS['invalid'], f"Invalid step index (max: {len(self.history) - 1})"
+        if step_index > self._hist_len - 1:
+            return self.REWARDS['invalid'], f"Invalid step index (max: {self._hist_len - 1})"
         
         # Step 1b: Calculate steps to delete
-        steps_to_delete = len(self.history) - 1 - step_index
+        steps_to_delete = self._hist_len - 1 - step_index
         
         # Step 2: Rollback
         self._internal_state = self.history[step_index]
-        self.history = self.history[:step_index + 1]
+        for i in range(step_index + 1, self._hist_len):
+            self.history[i] = None
+        self._hist_len = step_index + 1
         self.won = False  # Reset win state
+        self._update_terminal()
         
         reward = self.REWARDS['step']
         self.total_reward += reward
@@ -232,6 +316,17 @@ class CountleEngine:
         message = f"Rolled back {steps_to_delete} step(s) to step {step_index}"
         return reward, message
     
+    def undo(self) -> Tuple[int, str]:
+        """
+        Undo the last operation, by rolling back to the step before it.
+        
+        Returns:
+            (reward, message) tuple
+        """
+        if self._hist_len < 2:
+            return self.REWARDS['invalid'], "Nothing to undo"
+        return self.execute_rollback(self._hist_len - 2)
+    
     def execute_move(self, move: GameMove) -> Tuple[int, str]:
         """
         Execute a parsed move.
@@ -260,7 +355,7 @@ class CountleEngine:
         lines = [
             "----- Current Game State -----",
             f"Target: {self._internal_state.target}",
-            f"Current numbers: {self._internal_state.numbers}",
+            f"Current numbers: {self._internal_state.numbers.tolist()}",
             f"Moves made: {self.move_count}",
             f"Total reward: {self.total_reward}"
         ]
@@ -274,15 +369,46 @@ class CountleEngine:
     
     def get_history_summary(self) -> str:
         """Get a summary of move history."""
-        if len(self.history) == 1:
+        move_history = self._internal_state.move_history
+        if move_history is None:
             return "No moves yet"
         
         lines = ["Move history:"]
-        for i, state in enumerate(self.history[1:], 1):
-            lines.append(f"  {i}. {state.move_description}")
+        for i, move_desc in enumerate(move_history.to_list(), 1):
+            lines.append(f"  {i}. {move_desc}")
         return "\n".join(lines)
 
-    def generate_target(self, numbers, max_mc_steps = 1_000) -> int:
+    @staticmethod
+    def _apply_move_inplace(nums: List[int], i: int, j: int, result: int) -> Tuple[int, int, int, int]:
+        '''
+        Replace nums[i] and nums[j] by result (appended at the end), in place.
+
+        Returns:
+            Undo token for _undo_move_inplace
+        '''
+        lo, hi = (i, j) if i < j else (j, i)
+        # Remove larger index first to avoid shifting
+        removed_hi = nums.pop(hi)
+        removed_lo = nums.pop(lo)
+        nums.append(result)
+        return lo, hi, removed_lo, removed_hi
+
+    @staticmethod
+    def _undo_move_inplace(nums: List[int], token: Tuple[int, int, int, int]):
+        '''
+        Revert a move made by _apply_move_inplace. Moves must be undone in reverse order.
+        '''
+        lo, hi, removed_lo, removed_hi = token
+        nums.pop()
+        nums.insert(lo, removed_lo)
+        nums.insert(hi, removed_hi)
+
+    def generate_target(
+        self, 
+        numbers, 
+        max_mc_steps = 1_000, 
+        record_provenance: bool = False
+    ) -> Union[int, Tuple[int, Dict]]:
         '''
         To prevent cheesing and creating overly easy targets, we WANT TO generate
         the target by computing the "numerical closure" of the generated numbers
@@ -294,41 +420,149 @@ class CountleEngine:
 
         This way a solution is guaranteed, and it is increasingly unlikely
         that some trivial target is chosen as we increase the number of steps.
+
+        For small games (n <= EXACT_CLOSURE_MAX_N) the closure is small enough to
+        enumerate outright, so we do that instead and max_mc_steps is unused.
+
+        With record_provenance, returns (target, howtomake) instead, where howtomake maps
+        each sampled state key to {move: previous state key}. Only the Python sampler
+        records this, so it is always used in that case.
+        '''
+        howtomake = None
+        if record_provenance:
+            howtomake = {}
+            approx_closure = self._sample_closure(numbers, max_mc_steps, howtomake)
+        elif self.n <= self.EXACT_CLOSURE_MAX_N:
+            approx_closure = self._exact_closure(numbers)
+        elif NUMBA_AVAILABLE and fits_int64(self._lane_bits):
+            approx_closure = self._sample_closure_compiled(numbers, max_mc_steps)
+        else:
+            approx_closure = self._sample_closure(numbers, max_mc_steps)
+        
+        candidates = [num for num, step in approx_closure.items() if self.min_moves <= step < self.n]
+        
+        tgt = self.rng.choice(list(set(candidates) - set(numbers)))
+        if record_provenance:
+            return tgt, howtomake
+        return tgt
+
+    def _exact_closure(self, numbers: List[int]) -> Dict[int, int]:
+        '''
+        Compute the closure of numbers by BFS over the reachable multisets.
+
+        Returns:
+            Dict from each reachable number to the fewest steps it can be reached in
+        '''
+        # Lanes sized for these numbers specifically,
+        # as generate_target may be given numbers outside this engine's range.
+        lane_bits = lane_bits_for(numbers)
+
+        closure = {n: 0 for n in numbers}
+        frontier = [sorted(numbers)]
+        visited = set()
+        for depth in range(1, len(numbers)):
+            next_frontier = []
+            for values in frontier:
+                size = len(values)
+                for i in range(size):
+                    for j in range(size):
+                        if i == j:
+                            continue
+                        a, b = values[i], values[j]
+                        lo, hi = (i, j) if i < j else (j, i)
+                        for func in (OP_FUNCS if i < j else _SWAPPED_PAIR_FUNCS):
+                            result = func(a, b)
+                            if result is None:
+                                continue
+                            # BFS reaches every number at its smallest depth first
+                            if result not in closure:
+                                closure[result] = depth
+                            # Nothing more to reach from a single number
+                            if size == 2:
+                                continue
+
+                            successor = values[:lo] + values[lo + 1:hi] + values[hi + 1:]
+                            bisect.insort(successor, result)
+                            key = pack_numbers(successor, lane_bits)
+                            if key not in visited:
+                                visited.add(key)
+                                next_frontier.append(successor)
+            frontier = next_frontier
+
+        return closure
+
+    def _sample_closure_compiled(self, numbers: List[int], max_mc_steps: int) -> Dict[int, int]:
+        '''
+        Same as _sample_closure, but runs the rollouts in a compiled kernel.
+        The kernel is seeded from self.rng, so levels stay reproducible.
+        '''
+        results, steps = mc_rollouts(
+            np.asarray(numbers, dtype = np.int64),
+            max_mc_steps,
+            np.uint64(self.rng.getrandbits(64) | 1),   # xorshift state must be nonzero
+        )
+
+        approx_closure = {n: 0 for n in numbers}
+        for result, step in zip(results.tolist(), steps.tolist()):
+            if step < approx_closure.get(result, _UNREACHED):
+                approx_closure[result] = step
+        return approx_closure
+
+    def _sample_closure(
+        self, 
+        numbers: List[int], 
+        max_mc_steps: int, 
+        howtomake: Optional[Dict] = None
+    ) -> Dict[int, int]:
+        '''
+        Sample the closure of numbers with Monte Carlo random walks.
+        If howtomake is given, also records how each state was reached into it.
+
+        Returns:
+            Dict from each reached number to the fewest steps it was reached in
         '''
-        current_numbers = numbers.copy()
+        # A single scratch list is walked in place and unwound after every rollout.
+        temp_numbers = numbers.copy()
+        start_key = self._encode(temp_numbers)
 
-        howtomake = {tuple(current_numbers): None}
+        if howtomake is not None:
+            howtomake[start_key] = None
 
-        approx_closure = {n: 0 for n in current_numbers}
+        approx_closure = {n: 0 for n in temp_numbers}
         for _ in range(max_mc_steps):
-            temp_numbers = current_numbers.copy()
+            key = start_key
+            undo_stack = []
             
             for step in range(self.n - 1):
-                valid_moves = self.get_valid_moves(temp_numbers)
+                # Rollbacks are never sampled, so skip straight to the operations.
+                valid_moves = self._operation_moves(temp_numbers, key)
                 if not valid_moves:
                     break
-                move = self.rng.choice(list(filter(lambda m: m.move_type == MoveType.OPERATION, valid_moves)))
+                move = valid_moves[self.rng.randrange(len(valid_moves))]
                 
                 # Update current numbers
-                result = move.operation.apply(move.op1, move.op2)
+                result = move.operation.func(move.op1, move.op2)
                 assert result >= 0 and isinstance(result, int), "Generated invalid result in closure computation"
-                old_numbers = temp_numbers.copy()
-                temp_numbers.remove(move.op1)
-                temp_numbers.remove(move.op2)
-                temp_numbers.append(result)
+                i = temp_numbers.index(move.op1)
+                if move.op1 == move.op2:
+                    j = temp_numbers.index(move.op2, i + 1)
+                else:
+                    j = temp_numbers.index(move.op2)
+                undo_stack.append(self._apply_move_inplace(temp_numbers, i, j, result))
+                old_key, key = key, self._encode(temp_numbers)
                 
-                if tuple(temp_numbers) not in howtomake:
-                    howtomake[tuple(temp_numbers)] = {}
-                howtomake[tuple(temp_numbers)][str(move)] = tuple(old_numbers)
+                if howtomake is not None:
+                    howtomake.setdefault(key, {})[str(move)] = old_key
                 
                 # Track the result in the approx closure
-                if result < approx_closure.get(result, float('inf')):
-                    approx_closure[result] = step + 1  # Store the step count when first reached
-        
-        candidates = [num for num, step in approx_closure.items() if self.min_moves <= step < self.n]
-        
-        tgt = self.rng.choice(list(set(candidates) - set(numbers)))
-        return tgt
+                if step + 1 < approx_closure.get(result, _UNREACHED):
+                    approx_closure[result] = step + 1  # Store the fewest steps it was reached in
+
+            # Restore the starting numbers for the next rollout
+            while undo_stack:
+                self._undo_move_inplace(temp_numbers, undo_stack.pop())
+
+        return approx_closure
     
     def generate_level(self) -> GameState:
         '''
@@ -338,6 +572,8 @@ class CountleEngine:
             (numbers, target) tuple
         '''
         numbers = [self.rng.randint(1, self.max_number) for _ in range(self.n)]
+        # Cached moves from the previous level are unlikely to be hit again.
+        self._moves_cache.clear()
         target = self.generate_target(numbers)
 
         self._internal_state = GameState(
@@ -345,14 +581,21 @@ class CountleEngine:
             move_history = None, 
             target = target
         )
+        self._update_terminal()
 
         return self._internal_state
     
     def reset_history(self):
         '''
         Reset the move history to the current internal state.
+
+        Every operation removes a number, so the history never holds more states than
+        there are numbers now. Its slots are preallocated, and only the first
+        _hist_len are live.
         '''
-        self.history = [self._internal_state]
+        self.history = [None] * len(self._internal_state.numbers)
+        self.history[0] = self._internal_state
+        self._hist_len = 1
 
     '''
 
@@ -363,7 +606,9 @@ class CountleEngine:
     def load_state(self, state: GameState, total_reward: int = 0, move_count: int = 0):
         """Load a given game state into the engine."""
         self._internal_state = state
-        self.won = (self._internal_state.numbers == [self._internal_state.target])
+        numbers = self._internal_state.numbers
+        self.won = (len(numbers) == 1 and numbers[0] == self._internal_state.target)
+        self._update_terminal()
         self.total_reward = total_reward
         self.move_count = move_count
         self.reset_history()
@@ -401,7 +646,7 @@ class CountleEngine:
         engine = cls(
             num_numbers = len(state.numbers),
             min_moves = 0,  # min_moves is not relevant here
-            max_number = max(state.numbers + [state.target]),
+            max_number = max(state.numbers.tolist() + [state.target]),
             seed = seed
         )
         engine.load_state(state)
@@ -428,13 +673,23 @@ class CountleEngine:
         input_str = input_str.strip()
         
         # Check for rollback
-        rb_match = re.match(self.ROLLBACK_REGEX, input_str, re.IGNORECASE)
+        rb_match = self._ROLLBACK_RE.match(input_str)
         if rb_match:
             step = int(rb_match.group(1))
             return (MoveType.ROLLBACK, (step,))
         
-        # Check for operation
-        op_match = re.match(Operation.operation_regex(), input_str)
+        # Check for operation, trying a plain split for the usual "a op b" spacing first.
+        # isdecimal matches exactly what both \d and int() accept.
+        parts = input_str.split()
+        if (
+            len(parts) == 3
+            and parts[1] in SYMBOL_TO_OPERATION
+            and parts[0].isdecimal()
+            and parts[2].isdecimal()
+        ):
+            return (MoveType.OPERATION, (int(parts[0]), int(parts[2]), parts[1]))
+
+        op_match = _OP_RE.match(input_str)
         if op_match:
             num1 = int(op_match.group(1))
             op_symbol = op_match.group(2)
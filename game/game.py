@@ -24,14 +24,14 @@ class CountleGame:
         truncated = False  # Not used in this context
         info = {
             "message": message,
-            "current_numbers": self.engine.current_numbers,
+            "current_numbers": self.engine.current_numbers.tolist(),
             "target": self.engine.target
         }
 
         return self.engine._internal_state, reward, terminated, truncated, info
 
-    def get_valid_moves(self, game_state: GameState):
-        return self.engine.get_valid_moves(game_state.numbers)
+    def get_valid_moves(self, game_state: GameState, include_rollback: bool = True):
+        return self.engine.get_valid_moves(game_state.numbers, include_rollback)
     
     def make_from_numbers_and_target(self, numbers: List[int], target: int):
         self.engine = CountleEngine.create_from_numbers_and_target(
@@ -1,12 +1,116 @@
-from dataclasses import dataclass
-from typing import Optional, List, Tuple
+from dataclasses import dataclass, field
+from typing import Optional, List, Sequence, Tuple
 
-from game.types import MoveType
+import numpy as np
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
+class HistoryNode:
+    """
+    One move in a persistent move history.
+
+    Each node only points at the history before it, so extending a history is O(1)
+    and states branching off the same parent share its nodes.
+    """
+    prev: Optional['HistoryNode']
+    move_description: str
+
+    def to_list(self) -> List[str]:
+        """Get the move descriptions from the first move up to this one."""
+        moves = []
+        node = self
+        while node is not None:
+            moves.append(node.move_description)
+            node = node.prev
+        moves.reverse()
+        return moves
+
+@dataclass(frozen=True, slots=True, eq=False)
 class GameState:
-    """Represents a single state in the game."""
-    numbers: List[int]
-    move_history: Optional[List[Tuple[MoveType, List[int]]]] = None
+    """
+    Represents a single state in the game.
+
+    `numbers` is always held as an array, whatever sequence it is created from
+    (see number_array for its dtype).
+    `sorted_numbers` holds the same numbers as ascending Python ints, computed once here
+    so move generation and state keys don't have to sort them again.
+
+    States compare and hash by their multiset of numbers and target, since the
+    generated __eq__ would compare the arrays elementwise.
+    """
+    numbers: np.ndarray
+    move_history: Optional[HistoryNode] = None
     target: int = 0
     move_description: Optional[str] = None
+    sorted_numbers: Tuple[int, ...] = field(init = False, repr = False, compare = False)
+
+    def __post_init__(self):
+        numbers = number_array(self.numbers)
+        object.__setattr__(self, 'numbers', numbers)
+        object.__setattr__(self, 'sorted_numbers', tuple(sorted(numbers.tolist())))
+
+    def __eq__(self, other):
+        if not isinstance(other, GameState):
+            return NotImplemented
+        return self.sorted_numbers == other.sorted_numbers and self.target == other.target
+
+    def __hash__(self):
+        return hash((self.sorted_numbers, self.target))
+
+_INT64_MIN, _INT64_MAX = int(np.iinfo(np.int64).min), int(np.iinfo(np.int64).max)
+
+def number_array(numbers: Sequence[int]) -> np.ndarray:
+    '''
+    Get numbers as an int64 array, or as an object array of Python ints if any of them
+    doesn't fit in int64. int32 is not enough, since multiplying a handful of numbers
+    quickly overflows it, and a long enough game can overflow int64 too; numpy would
+    silently wrap those rather than fail.
+    '''
+    if isinstance(numbers, np.ndarray):
+        if numbers.dtype == np.int64:
+            return numbers
+        numbers = numbers.tolist()
+    if all(_INT64_MIN <= x <= _INT64_MAX for x in numbers):
+        return np.asarray(numbers, dtype = np.int64)
+    return np.array([int(x) for x in numbers], dtype = object)
+
+def lane_bits_for(numbers: Sequence[int]) -> int:
+    '''
+    Lane width that fits every number reachable from `numbers`, for pack_numbers.
+
+    Every result r of a and b satisfies r + 1 <= (a + 1) * (b + 1), so no reachable
+    number plus one exceeds the product of (x + 1) over the starting numbers.
+    '''
+    return sum((x + 1).bit_length() for x in numbers)
+
+def fits_int64(lane_bits: int) -> bool:
+    '''
+    Whether every number reachable from numbers with this lane_bits_for fits in int64,
+    which the compiled kernels and array solvers work in. Every reachable number is
+    below 2 ** lane_bits, so lanes of up to 62 bits are enough.
+    '''
+    return lane_bits < 63
+
+def pack_numbers(numbers: Sequence[int], lane_bits: int) -> int:
+    '''
+    Pack an ascending sequence of non-negative numbers into a single int,
+    for use as a cheap-to-hash key of the multiset.
+
+    Each number is stored plus one in its own `lane_bits` wide lane, so zeros still
+    contribute to the key. Every number must be below `(1 << lane_bits) - 1`.
+    '''
+    key = 0
+    for x in numbers:
+        key = (key << lane_bits) | (x + 1)
+    return key
+
+def unpack_numbers(key: int, lane_bits: int) -> List[int]:
+    '''
+    Inverse of pack_numbers, giving the numbers in ascending order.
+    '''
+    mask = (1 << lane_bits) - 1
+    numbers = []
+    while key:
+        numbers.append((key & mask) - 1)
+        key >>= lane_bits
+    numbers.reverse()
+    return numbers
@@ -1,20 +1,31 @@
+import operator
+import re
 from enum import Enum
-from typing import Callable, Optional
+from typing import Callable, Dict, Optional, Pattern, Tuple
+
+# "<num1> <op> <num2>", compiled once for Operation.operation_regex
+_OPERATION_RE = re.compile(r'^(\d+)\s*([+\-*/])\s*(\d+)$')
 
 class MoveType(Enum):
     """Type of move in the game."""
     OPERATION = "operation"
     ROLLBACK = "rollback"
 
+def _subtract(a: int, b: int) -> Optional[int]:
+    return a - b if a >= b else None
+
+def _divide(a: int, b: int) -> Optional[int]:
+    return a // b if b != 0 and a % b == 0 else None
+
 class Operation(Enum):
     """
     Supported arithmetic operations.
     Responsible for tagging invalid operations with `None` results.
     """
-    ADD = ('+', int.__add__)
-    SUBTRACT = ('-', lambda a, b: a - b if a >= b else None)
-    MULTIPLY = ('*', int.__mul__)
-    DIVIDE = ('/', lambda a, b: a // b if b != 0 and a % b == 0 else None)
+    ADD = ('+', operator.add)
+    SUBTRACT = ('-', _subtract)
+    MULTIPLY = ('*', operator.mul)
+    DIVIDE = ('/', _divide)
     
     def __init__(self, symbol: str, func: Callable):
         self.symbol = symbol
@@ -22,14 +33,24 @@ class Operation(Enum):
     
     @classmethod
     def from_symbol(cls, symbol: str) -> Optional['Operation']:
-        for op in cls:
-            if op.symbol == symbol:
-                return op
-        return None
+        return SYMBOL_TO_OPERATION.get(symbol)
     
     @classmethod
-    def operation_regex(cls) -> str:
-        return r'^(\d+)\s*([+\-*/])\s*(\d+)$'
+    def operation_regex(cls) -> Pattern[str]:
+        return _OPERATION_RE
     
     def apply(self, a: int, b: int) -> Optional[int]:
-        return self.func(a, b)
\ No newline at end of file
+        return self.func(a, b)
+
+# (symbol, func) of every operation, in Operation order.
+# Hot loops can iterate this directly instead of going through the enum and `apply`.
+OPERATION_TABLE: Tuple[Tuple[str, Callable[[int, int], Optional[int]]], ...] = tuple(
+    (op.symbol, op.func) for op in Operation
+)
+
+# Lookup for Operation.from_symbol, built once
+SYMBOL_TO_OPERATION: Dict[str, Operation] = {op.symbol: op for op in Operation}
+
+# The same table split in two, indexed by operation index (position in Operation).
+OP_SYMBOLS: Tuple[str, ...] = tuple(symbol for symbol, _ in OPERATION_TABLE)
+OP_FUNCS: Tuple[Callable[[int, int], Optional[int]], ...] = tuple(func for _, func in OPERATION_TABLE)
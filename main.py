@@ -1,5 +1,6 @@
 import argparse
-from solver import AStarSolver, BFSSolver, GreedySolver, RandomSolver
+from typing import Optional
+from solver import AStarSolver, BeamBFSSolver, BFSSolver, BidirectionalBFSSolver, GPUBFSSolver, GreedySolver, IDAStarSolver, RandomSolver
 
 from game.game import CountleGame
 
@@ -8,8 +9,25 @@ STRATEGY_TO_SOLVER = {
     'random': RandomSolver,
     'astar': AStarSolver,
     'bfs': BFSSolver,
+    'bibfs': BidirectionalBFSSolver,
+    'gpubfs': GPUBFSSolver,
+    'beam': BeamBFSSolver,
+    'idastar': IDAStarSolver,
 }
 
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+def make_solver(game: CountleGame, strategy: str, processes: Optional[int] = None):
+    solver_class = STRATEGY_TO_SOLVER.get(strategy, GreedySolver)
+    # Only BFSSolver expands layers in worker processes
+    if solver_class is BFSSolver:
+        return solver_class(game, processes = processes)
+    return solver_class(game)
+
 def get_argparser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description = "Countle Solver"
@@ -57,15 +75,25 @@ def get_argparser() -> argparse.ArgumentParser:
         default = 3,
         help = 'Minimum number of moves to reach the target (default: 3)'
     )
+
+    parser.add_argument(
+        '--processes', 
+        type = positive_int, 
+        default = None,
+        help = 'Worker processes for expanding large BFS layers, bfs strategy only (default: search in a single process)'
+    )
     
     return parser
 
 def play_interactive(game: CountleGame):
     print("Welcome to Countle!")
     print("Type 'help' for a list of commands.")
+    game.reset()
+    # Reuse solvers across solve commands, so they can reuse work from earlier ones
+    solvers = {}
     while True:
-        print("\nCurrent Numbers:", game.current_numbers)
-        print("Target:", game.current_target)
+        print("\nCurrent Numbers:", game.engine.current_numbers.tolist())
+        print("Target:", game.engine.target)
         user_input = input("Enter your command: ").strip().lower()
         
         if user_input == 'help':
@@ -84,29 +112,36 @@ def play_interactive(game: CountleGame):
                 num1 = int(parts[1])
                 op = parts[2]
                 num2 = int(parts[3])
-                move = (num1, op, num2)
-                game.apply_move(move)
-                if game.won:
+                _, message = game.engine.execute_operation(num1, num2, op)
+                print(message)
+                if game.engine.won:
                     print("Congratulations! You've reached the target!")
                     break
             except Exception as e:
                 print(f"Error applying move: {e}")
         elif user_input == 'undo':
-            try:
-                game.undo_move()
-            except Exception as e:
-                print(f"Error undoing move: {e}")
+            _, message = game.engine.undo()
+            print(message)
         elif user_input == 'reset':
-            game.reset_game()
+            _, message = game.engine.execute_rollback(0)
+            print(message)
         elif user_input.startswith('solve'):
             parts = user_input.split()
             strategy = parts[1] if len(parts) > 1 else 'greedy'
             
             solver_class = STRATEGY_TO_SOLVER.get(strategy, GreedySolver)
-            solver = solver_class(game)
-            solver.solve(game.current_state)
+            if solver_class not in solvers:
+                solvers[solver_class] = solver_class(game)
+            success, solution_path = solvers[solver_class].solve(game.engine._internal_state)
             
-            if game.won:
+            if success:
+                print("Solution found! Moves:")
+                for state in solution_path[1:]:
+                    print(f"  {state.move_description}")
+            else:
+                print("Failed to find a solution.")
+            
+            if game.engine.won:
                 break
         elif user_input == 'exit':
             print("Exiting the game. Goodbye!")
@@ -114,24 +149,23 @@ def play_interactive(game: CountleGame):
         else:
             print("Unknown command. Type 'help' for a list of commands.")
 
-def play_demo(game: CountleGame, strategy: str):
+def play_demo(game: CountleGame, strategy: str, processes: Optional[int] = None):
     print(f"Giving demo using strategy: {strategy}")
-    solver_class = STRATEGY_TO_SOLVER.get(strategy, GreedySolver)
-    solver = solver_class(game)
+    solver = make_solver(game, strategy, processes)
     success, solution_path = solver.solve()
     
     if success:
         print("Solution found! Steps:")
         for i, state in enumerate(solution_path[1:]):
             print(
-                f"Step {i + 1}: Numbers: {state.numbers}, "
+                f"Step {i + 1}: Numbers: {state.numbers.tolist()}, "
                 f"Target: {state.target}, "
                 f"Move: {state.move_description}"
             )
     else:
         print("Failed to find a solution.")
 
-def play_solve(game: CountleGame, strategy: str):
+def play_solve(game: CountleGame, strategy: str, processes: Optional[int] = None):
     # TODO: Would be funny if we can actually connect to countle.org and solve it.
 
     print(f"Solving using strategy: {strategy}")
@@ -139,15 +173,14 @@ def play_solve(game: CountleGame, strategy: str):
     # Lowkey breaking abstraction, but oh well.
     initial_state = game.engine._internal_state
     
-    solver_class = STRATEGY_TO_SOLVER.get(strategy, GreedySolver)
-    solver = solver_class(game)
+    solver = make_solver(game, strategy, processes)
     success, solution_path = solver.solve(initial_state)
     
     if success:
         print("Solution found! Steps:")
         for i, state in enumerate(solution_path[1:]):
             print(
-                f"Step {i + 1}: Numbers: {state.numbers}, "
+                f"Step {i + 1}: Numbers: {state.numbers.tolist()}, "
                 f"Target: {state.target}, "
                 f"Move: {state.move_description}"
             )
@@ -170,7 +203,7 @@ def main():
     if args.mode == 'interactive':
         play_interactive(game)
     elif args.mode == 'demo':
-        play_demo(game, args.strategy)
+        play_demo(game, args.strategy, args.processes)
     elif args.mode == 'solve':
             initialization = input(
                 "Enter n+1 numbers (n numbers, 1 target) separated by spaces " 
@@ -183,7 +216,7 @@ def main():
                 numbers = all_numbers[:-1],
                 target = all_numbers[-1]
             )
-            play_solve(game, args.strategy)
+            play_solve(game, args.strategy, args.processes)
 
     
 
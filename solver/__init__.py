@@ -1,4 +1,7 @@
-from solver.bfs import BFSSolver
+from solver.bfs import BFSSolver, BidirectionalBFSSolver
+from solver.bfs_gpu import GPUBFSSolver
 from solver.astar import AStarSolver
+from solver.beam import BeamBFSSolver
+from solver.idastar import IDAStarSolver
 from solver.greedy import GreedySolver
 from solver.random import RandomSolver
\ No newline at end of file
@@ -0,0 +1,240 @@
+'''
+Node expansion shared by the search solvers, with a numba-compiled fast path,
+and the compact search tree bookkeeping that goes with it.
+'''
+from bisect import insort
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from game._kernels import NUMBA_AVAILABLE, njit
+from game.state import GameState, HistoryNode, pack_numbers, unpack_numbers
+from game.types import OP_FUNCS, OP_SYMBOLS
+
+# Operation indices used by expand, in Operation / OPERATION_TABLE order
+ADD, SUBTRACT, MULTIPLY, DIVIDE = range(4)
+
+@njit(cache=True)
+def _put_row(out, count, i, j, op, result):
+    out[count, 0] = i
+    out[count, 1] = j
+    out[count, 2] = op
+    out[count, 3] = result
+    return count + 1
+
+@njit(cache=True)
+def _expand_compiled(numbers):
+    n = numbers.shape[0]
+    out = np.empty((n * (n - 1) * 3, 4), np.int64)
+    count = 0
+    for i in range(n):
+        a = numbers[i]
+        for j in range(i + 1, n):
+            b = numbers[j]
+            # Commutative operations once per pair, the others both ways round
+            count = _put_row(out, count, i, j, ADD, a + b)
+            count = _put_row(out, count, i, j, MULTIPLY, a * b)
+            if a >= b:
+                count = _put_row(out, count, i, j, SUBTRACT, a - b)
+            if b >= a:
+                count = _put_row(out, count, j, i, SUBTRACT, b - a)
+            if b != 0 and a % b == 0:
+                count = _put_row(out, count, i, j, DIVIDE, a // b)
+            if a != 0 and b % a == 0:
+                count = _put_row(out, count, j, i, DIVIDE, b // a)
+    return out[:count]
+
+def expand(numbers: Sequence[int], use_compiled: bool = NUMBA_AVAILABLE) -> List[List[int]]:
+    '''
+    Get every valid operation on a pair of numbers.
+    Commutative operations are only listed once per pair, with i < j.
+
+    Args:
+        numbers: Numbers as a list of ints or an int64 array, as held by GameState
+        use_compiled: Whether to use the numba kernel. Callers should pass False
+                      if results may not fit in int64.
+
+    Returns:
+        List of [i, j, operation index, result] rows, where result is numbers[i] op numbers[j].
+        Rows are grouped by unordered pair {i, j}, in the same order either way.
+    '''
+    if use_compiled:
+        return _expand_compiled(np.asarray(numbers, dtype=np.int64)).tolist()
+
+    values = numbers.tolist() if isinstance(numbers, np.ndarray) else numbers
+    return _make_expander(len(values))(values)
+
+@lru_cache(maxsize = 16)
+def _make_expander(n: int) -> Callable[[Sequence[int]], List[List[int]]]:
+    '''
+    Generate the Python fallback of expand for exactly n numbers.
+
+    The pairs are written out as straight-line code, so there is no loop bookkeeping
+    and indices are constants. Each operation is unrolled like in the kernel:
+    commutative operations once per pair, the others both ways round.
+    '''
+    lines = [
+        "def expand_n(values):",
+        "    rows = []",
+        "    append = rows.append",
+    ]
+    if n:
+        lines.append("    " + ", ".join(f"v{i}" for i in range(n)) + ", = values")
+    for i in range(n):
+        for j in range(i + 1, n):
+            a, b = f"v{i}", f"v{j}"
+            lines += [
+                f"    append([{i}, {j}, {ADD}, {a} + {b}])",
+                f"    append([{i}, {j}, {MULTIPLY}, {a} * {b}])",
+                f"    if {a} >= {b}:",
+                f"        append([{i}, {j}, {SUBTRACT}, {a} - {b}])",
+                f"    if {b} >= {a}:",
+                f"        append([{j}, {i}, {SUBTRACT}, {b} - {a}])",
+                f"    if {b} != 0 and {a} % {b} == 0:",
+                f"        append([{i}, {j}, {DIVIDE}, {a} // {b}])",
+                f"    if {a} != 0 and {b} % {a} == 0:",
+                f"        append([{j}, {i}, {DIVIDE}, {b} // {a}])",
+            ]
+    lines.append("    return rows")
+
+    namespace = {}
+    exec(compile("\n".join(lines), f"<expand_{n}>", "exec"), namespace)
+    return namespace["expand_n"]
+
+def encode_move(i: int, j: int, op_index: int) -> int:
+    '''
+    Pack a move on sorted numbers into a small int: 8 bits per operand index, 2 for the operation.
+    '''
+    return (i << 10) | (j << 2) | op_index
+
+def decode_move(code: int) -> Tuple[int, int, int]:
+    '''
+    Inverse of encode_move, giving (i, j, operation index).
+    '''
+    return code >> 10, (code >> 2) & 0xFF, code & 3
+
+def child_numbers(numbers: List[int], i: int, j: int, result: int) -> List[int]:
+    '''
+    Get the sorted numbers left after combining numbers[i] and numbers[j] into result.
+    numbers must be sorted, so dropping both operands keeps it sorted.
+    '''
+    lo, hi = (i, j) if i < j else (j, i)
+    new_values = numbers[:lo] + numbers[lo + 1:hi] + numbers[hi + 1:]
+    insort(new_values, result)
+    return new_values
+
+def expand_key(
+    key: int, 
+    lane_bits: int, 
+    use_compiled: bool = NUMBA_AVAILABLE
+) -> List[Tuple[int, int, int]]:
+    '''
+    Get the children of a packed state, for solvers that deal only in keys.
+    Module-level and int-only, so it can be sent to worker processes.
+
+    Args:
+        key: Packed numbers of the state
+        lane_bits: Lane width the key was packed with
+        use_compiled: Passed on to expand
+
+    Returns:
+        List of (child key, move code from encode_move, result of the move), in expand order
+    '''
+    numbers = unpack_numbers(key, lane_bits)
+    return [
+        (pack_numbers(child_numbers(numbers, i, j, result), lane_bits), encode_move(i, j, op_index), result)
+        for i, j, op_index, result in expand(numbers, use_compiled)
+    ]
+
+def path_codes(parent_ids: Sequence[int], move_codes: Sequence[int], state_id: int) -> List[int]:
+    '''
+    Get the move codes leading to a state in a search tree stored as parallel arrays,
+    where state 0 is the root and every other state s was reached from
+    parent_ids[s] by the move move_codes[s].
+    '''
+    codes = []
+    while state_id != 0:
+        codes.append(move_codes[state_id])
+        state_id = parent_ids[state_id]
+    codes.reverse()
+    return codes
+
+def replay_moves(
+    initial_state: GameState, 
+    parent_ids: Sequence[int], 
+    move_codes: Sequence[int], 
+    state_id: int
+) -> List[GameState]:
+    '''
+    Rebuild the path to a state from a search tree stored as parallel arrays
+    (see path_codes), where state 0 is initial_state.
+
+    Only moves are stored, so numbers and move descriptions are recomputed here
+    by replaying the moves forward from the initial numbers.
+    '''
+    return replay_codes(initial_state, path_codes(parent_ids, move_codes, state_id))
+
+class SolutionMemo:
+    '''
+    Solutions from previous solve calls of a solver, so repeated calls on the same numbers
+    (e.g. while playing interactively) don't search again.
+
+    Maps (lane_bits, start_key, target) to the move codes of the solution, or None if
+    there is none. Moves rather than states are kept, so each hit is replayed onto the
+    caller's own initial_state and history. Past max_size entries, the least recently
+    used one is dropped; dicts keep insertion order and hits are reinserted, so that's
+    always the first.
+    '''
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._codes: Dict[Tuple[int, int, int], Optional[Tuple[int, ...]]] = {}
+
+    def __contains__(self, key: Tuple[int, int, int]) -> bool:
+        return key in self._codes
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def lookup(self, key: Tuple[int, int, int], initial_state: GameState) -> Tuple[bool, Optional[List[GameState]]]:
+        '''
+        Get the remembered result for key, as (success, path from initial_state).
+        key must be in the memo.
+        '''
+        codes = self._codes.pop(key)
+        self._codes[key] = codes
+        if codes is None:
+            return False, None
+        return True, replay_codes(initial_state, codes)
+
+    def remember(self, key: Tuple[int, int, int], codes: Optional[Sequence[int]]):
+        '''
+        Store the move codes solving key, or None if it has no solution.
+        '''
+        self._codes[key] = None if codes is None else tuple(codes)
+        if len(self._codes) > self.max_size:
+            del self._codes[next(iter(self._codes))]
+
+def replay_codes(initial_state: GameState, codes: Sequence[int]) -> List[GameState]:
+    '''
+    Get the states visited by playing the encode_move codes in order from initial_state,
+    starting with initial_state itself. Each state's move_history continues initial_state's.
+    '''
+    path = [initial_state]
+    numbers = list(initial_state.sorted_numbers)
+    history = initial_state.move_history
+    for code in codes:
+        i, j, op_index = decode_move(code)
+        a, b = numbers[i], numbers[j]
+        result = OP_FUNCS[op_index](a, b)
+        numbers = child_numbers(numbers, i, j, result)
+        move_desc = f"{a} {OP_SYMBOLS[op_index]} {b} = {result}"
+        # Each state's history extends its parent's, sharing the earlier nodes
+        history = HistoryNode(history, move_desc)
+        path.append(GameState(
+            numbers=numbers, 
+            move_history=history, 
+            move_description=move_desc, 
+            target=initial_state.target
+        ))
+    return path
@@ -1,31 +1,19 @@
 # Solver using A* search algorithm for Countle game
 from typing import List, Tuple, Dict, Optional
+from array import array
 from heapq import heappop, heappush
-from dataclasses import dataclass, field
 
-from game.state import GameState
-from game.types import Operation, MoveType
+from game.state import GameState, fits_int64, lane_bits_for, pack_numbers, unpack_numbers
+from game._kernels import NUMBA_AVAILABLE
 from game.engine import CountleEngine
 from solver.base import BaseSolver
-
-@dataclass(frozen=True)
-class AStarNode:
-    f: int  # Total estimated cost (g + h)
-    g: int  # Cost from start to current node
-    state: GameState = field(compare=False)
-
-    def __lt__(self, other):
-        return (
-            self.f < other.f
-            or (self.f == other.f and self.g < other.g)
-        )
-            
+from solver._kernels import SolutionMemo, child_numbers, encode_move, expand, path_codes, replay_codes
 
 class AStarSolver(BaseSolver):
     '''
     Uses A* Search to solve the Countle game.
 
-    There probably isn't an actual heuristic here yet, but the structure is set up for it.
+    The heuristic is a simple lower bound on the number of operations left.
     '''
     def __init__(
         self, 
@@ -39,104 +27,100 @@ class AStarSolver(BaseSolver):
             **kwargs
         )
         self.game = game
+        # Solutions from previous solve calls, see SolutionMemo
+        self._memo = SolutionMemo()
 
-    def heuristic(self, numbers: Tuple[int, ...], target: int) -> int:
-        # Placing the trivial heuristic here for now.
-        return 0
+    def heuristic(self, numbers: List[int], target: int) -> int:
+        # Every operation replaces two numbers with one, so if the target isn't here
+        # yet at least one more operation is needed.
+        # This never overestimates and changes by at most 1 per move, so it's consistent.
+        return 0 if target in numbers else 1
 
     def solve(
         self, 
-        initial_state: GameState = None
+        initial_state: GameState = None, 
+        verbose: bool = False
     ) -> Tuple[bool, List[GameState]]:
-        
         if initial_state is None:
             # Generate a new level if no state provided
-            print("No initial state provided, generating a new level.")
+            if verbose:
+                print("No initial state provided, generating a new level.")
             initial_state = self.game.reset()
         
         target = initial_state.target
-        start_numbers = tuple(sorted(initial_state.numbers))
+        # States are keyed by their sorted numbers packed into a single int
+        lane_bits = lane_bits_for(initial_state.numbers.tolist())
+        start_key = pack_numbers(initial_state.sorted_numbers, lane_bits)
+        use_compiled = NUMBA_AVAILABLE and fits_int64(lane_bits)
+
+        memo_key = (lane_bits, start_key, target)
+        if memo_key in self._memo:
+            success, path = self._memo.lookup(memo_key, initial_state)
+            if not success and verbose:
+                print(f"No solution found using A*. State: {initial_state}, Target: {target}")
+            return success, path
         
-        # Priority queue: (Priority, Cost, State)
-        pq = [AStarNode(0, 0, initial_state)]
+        # The search tree, as parallel arrays indexed by state id (in order of discovery).
+        # State 0 is the initial state; every other state was reached from
+        # parent_ids[id] by the move move_codes[id] (see encode_move).
+        state_ids: Dict[int, int] = {start_key: 0}
+        parent_ids = array('i', [-1])
+        move_codes = array('I', [0])
         
-        # came_from: current_numbers -> (parent_numbers, move_description)
-        came_from: Dict[Tuple[int, ...], Tuple[Optional[Tuple[int, ...]], Optional[str]]] = {
-            start_numbers: (None, None)
-        }
+        # Children are checked for the target as they are generated, so only the start
+        # needs checking here. Each move only adds its result, so a child reaches the
+        # target exactly when its result is the target.
+        # Stopping there is still optimal: every open state has f >= g + 1, the depth
+        # of the child, so none of them can lead to a shorter solution.
+        solution_found = target in initial_state.sorted_numbers
+        final_id = 0 if solution_found else None
         
-        solution_found = False
-        final_numbers = None
+        # Priority queue: (Priority, Cost, State id, Key)
+        # Plain tuples compare in C; state ids are unique, so entries never compare keys.
+        pq = [] if solution_found else [(0, 0, 0, start_key)]
         
         while pq:
-            curr_node = heappop(pq)
-            f, g, current_state = curr_node.f, curr_node.g, curr_node.state
+            f, g, current_id, current_key = heappop(pq)
             
-            # Check if target is reached
-            if target in current_state.numbers:
-                solution_found = True
-                final_numbers = tuple(sorted(current_state.numbers))
-                break
+            # Frontier entries only hold keys; the parallel arrays hold the rest of the tree
+            numbers = unpack_numbers(current_key, lane_bits)
 
             # Else check if we went too far.
-            if len(current_state.numbers) == 1:
+            if len(numbers) == 1:
                 continue
             
-            # Generate neighbors
-            valid_moves = self.game.get_valid_moves(
-                current_state
-            )
-            for move in valid_moves:
-                # We don't actually need to rollback if we are doing BFS.
-                # If the path is unsuccessful, we just discard it.
-                if move.move_type != MoveType.OPERATION:
-                    continue
-                
-                result = move.operation.apply(move.op1, move.op2)
-                new_numbers = current_state.numbers.copy()
-                new_numbers.remove(move.op1)
-                new_numbers.remove(move.op2)
-                new_numbers.append(result)
-                new_numbers_tuple = tuple(sorted(new_numbers))
-                
-                if new_numbers_tuple not in came_from:
-                    came_from[new_numbers_tuple] = (
-                        tuple(sorted(current_state.numbers)), 
-                        f"{move} = {result}"
-                    )
-                    new_state = GameState(
-                        numbers=new_numbers, 
-                        move_history=(current_state.move_history or []) + [new_numbers],
-                        target=target
-                    )
+            # Generate neighbors from every valid operation on a pair of numbers.
+            # We don't need rollbacks either: if a path is unsuccessful, we just discard it.
+            for i, j, op_index, result in expand(numbers, use_compiled):
+                new_values = child_numbers(numbers, i, j, result)
+                new_key = pack_numbers(new_values, lane_bits)
+
+                # Every operation removes exactly one number, so g is the same along any
+                # path to a state. The first time a state is seen is therefore already its
+                # best g, and each state is pushed at most once: no g-score table,
+                # closed set or stale heap entries needed.
+                new_id = state_ids.setdefault(new_key, len(parent_ids))
+                if new_id == len(parent_ids):
+                    parent_ids.append(current_id)
+                    move_codes.append(encode_move(i, j, op_index))
+                    if result == target:
+                        solution_found = True
+                        final_id = new_id
+                        break
                     new_g = g + 1
-                    new_h = self.heuristic(new_numbers_tuple, target)
+                    new_h = self.heuristic(new_values, target)
                     new_f = new_g + new_h
-                    heappush(pq, AStarNode(
-                        new_f, 
-                        new_g,
-                        new_state
-                    ))
+                    heappush(pq, (new_f, new_g, new_id, new_key))
+
+            if solution_found:
+                break
         
         if solution_found:
-            # Reconstruct path
-            path = []
-            curr = final_numbers
-            while curr != start_numbers:
-                print(f"Reconstructing step: {curr}")
-                parent, move_desc = came_from[curr]
-                state = GameState(
-                    numbers=list(curr), 
-                    move_description=move_desc, 
-                    target=target
-                )
-                path.append(state)
-                curr = parent
-            
-            # Add initial state
-            path.append(initial_state)
-            path.reverse()
-            return True, path
+            codes = path_codes(parent_ids, move_codes, final_id)
+            self._memo.remember(memo_key, codes)
+            return True, replay_codes(initial_state, codes)
         else:
-            print(f"No solution found using A*. State: {initial_state}, Target: {target}")
+            self._memo.remember(memo_key, None)
+            if verbose:
+                print(f"No solution found using A*. State: {initial_state}, Target: {target}")
             return False, None
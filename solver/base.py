@@ -9,10 +9,15 @@ class BaseSolver(ABC):
         pass
 
     @abstractmethod
-    def solve(self, initial_state: GameState = None) -> Tuple[List[GameState], bool]:
+    def solve(self, initial_state: GameState = None, verbose: bool = False) -> Tuple[bool, List[GameState]]:
         """
         Solve the Countle game.
 
+        Args:
+            initial_state: State to solve from. If None, a new level is generated.
+            verbose: Whether to print diagnostics. They are off by default, so
+                     batch runs and benchmarks don't pay for console output.
+
         Returns:
             A tuple containing:
             - Boolean indicating whether the solution was successful.
@@ -0,0 +1,95 @@
+# Solver using beam search for Countle game
+from typing import List, Tuple, Dict
+from array import array
+from heapq import nsmallest
+
+from game.state import GameState, fits_int64, lane_bits_for, pack_numbers
+from game._kernels import NUMBA_AVAILABLE
+from game.engine import CountleEngine
+from solver.base import BaseSolver
+from solver._kernels import child_numbers, encode_move, expand, replay_moves
+
+class BeamBFSSolver(BaseSolver):
+    '''
+    BFS that only keeps the beam_width most promising states of each depth.
+
+    Much cheaper than BFS when there are many numbers, since the size of each layer is
+    capped instead of growing combinatorially. The catch is that pruned states are gone
+    for good, so solutions aren't guaranteed to be found, or to be the shortest.
+    '''
+    def __init__(
+        self, 
+        game: CountleEngine, 
+        *args, 
+        beam_width: int = 64,
+        **kwargs
+    ):
+        super().__init__(
+            game, 
+            *args, 
+            **kwargs
+        )
+        self.game = game
+        self.beam_width = beam_width
+
+    def score(self, numbers: List[int], target: int) -> int:
+        # How far the closest number is from the target. Lower is better.
+        return min(abs(target - x) for x in numbers)
+
+    def solve(
+        self, 
+        initial_state: GameState = None, 
+        verbose: bool = False
+    ) -> Tuple[bool, List[GameState]]:
+        if initial_state is None:
+            # Generate a new level if no state provided
+            if verbose:
+                print("No initial state provided, generating a new level.")
+            initial_state = self.game.reset()
+        
+        target = initial_state.target
+        # States are keyed by their sorted numbers packed into a single int
+        lane_bits = lane_bits_for(initial_state.numbers.tolist())
+        start_key = pack_numbers(initial_state.sorted_numbers, lane_bits)
+        use_compiled = NUMBA_AVAILABLE and fits_int64(lane_bits)
+        
+        # The search tree, as parallel arrays indexed by state id, like in BFSSolver
+        state_ids: Dict[int, int] = {start_key: 0}
+        parent_ids = array('i', [-1])
+        move_codes = array('I', [0])
+        
+        # Beam entries: (State id, Numbers)
+        beam = [(0, list(initial_state.sorted_numbers))]
+        while beam:
+            for current_id, numbers in beam:
+                # Check if target is reached
+                if target in numbers:
+                    path = replay_moves(initial_state, parent_ids, move_codes, current_id)
+                    return True, path
+            
+            # Candidates: (Score, State id, Numbers). Ids are unique, so numbers never get compared.
+            candidates = []
+            for current_id, numbers in beam:
+                # Else check if we went too far.
+                if len(numbers) == 1:
+                    continue
+
+                for i, j, op_index, result in expand(numbers, use_compiled):
+                    new_values = child_numbers(numbers, i, j, result)
+                    new_key = pack_numbers(new_values, lane_bits)
+
+                    new_id = state_ids.setdefault(new_key, len(parent_ids))
+                    if new_id == len(parent_ids):
+                        parent_ids.append(current_id)
+                        move_codes.append(encode_move(i, j, op_index))
+                        candidates.append((self.score(new_values, target), new_id, new_values))
+            
+            # Keep only the best states of the next depth
+            beam = [
+                (new_id, new_values)
+                for _, new_id, new_values in nsmallest(self.beam_width, candidates)
+            ]
+        
+        if verbose:
+            print(f"No solution found using beam search. State: {initial_state}, Target: {target}")
+        return False, None
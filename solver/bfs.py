@@ -1,21 +1,31 @@
-from collections import deque
+from array import array
+from functools import partial
+from multiprocessing import Pool
 from typing import List, Tuple, Dict, Optional
 
-from game.state import GameState
-from game.types import MoveType
+from game.state import GameState, HistoryNode, fits_int64, lane_bits_for, pack_numbers
+from game._kernels import NUMBA_AVAILABLE
 from game.engine import CountleEngine
+from game.types import OP_FUNCS, OP_SYMBOLS
 from solver.base import BaseSolver
+from solver._kernels import SolutionMemo, expand_key, path_codes, replay_codes
 
 class BFSSolver(BaseSolver):
     '''
     Uses Breadth-First Search to solve the Countle game.
 
     Tantamount to bruteforcing, but BFS guarantees the shortest path solution.
+
+    Pass processes to expand large layers of the search in a multiprocessing pool.
     '''
+    # Layers smaller than this are expanded in this process even with a pool
+    PARALLEL_MIN_FRONTIER = 32
+
     def __init__(
         self, 
         game: CountleEngine, 
         *args, 
+        processes: Optional[int] = None,
         **kwargs
     ):
         super().__init__(
@@ -24,92 +34,267 @@ class BFSSolver(BaseSolver):
             **kwargs
         )
         self.game = game
+        # Number of worker processes, or None to search in this process only
+        self.processes = processes
+        # Solutions from previous solve calls, see SolutionMemo
+        self._memo = SolutionMemo()
 
     def solve(
         self, 
-        initial_state: GameState = None
+        initial_state: GameState = None, 
+        verbose: bool = False
     ) -> Tuple[bool, List[GameState]]:
-        
         if initial_state is None:
             # Generate a new level if no state provided
-            print("No initial state provided, generating a new level.")
+            if verbose:
+                print("No initial state provided, generating a new level.")
             initial_state = self.game.reset()
         
         target = initial_state.target
-        start_numbers = tuple(sorted(initial_state.numbers))
-        
-        # Deque: (Cost, State)
-        queue = deque([(0, initial_state)])
+        # States are keyed by their sorted numbers packed into a single int
+        lane_bits = lane_bits_for(initial_state.numbers.tolist())
+        start_key = pack_numbers(initial_state.sorted_numbers, lane_bits)
+        use_compiled = NUMBA_AVAILABLE and fits_int64(lane_bits)
+
+        memo_key = (lane_bits, start_key, target)
+        if memo_key in self._memo:
+            success, path = self._memo.lookup(memo_key, initial_state)
+            if not success and verbose:
+                print(f"No solution found using BFS. State: {initial_state}, Target: {target}")
+            return success, path
         
-        # came_from: current_numbers -> (parent_numbers, move_description)
-        came_from: Dict[Tuple[int, ...], Tuple[Optional[Tuple[int, ...]], Optional[str]]] = {
-            start_numbers: (None, None)
-        }
+        # The search tree, as parallel arrays indexed by state id (in order of discovery).
+        # State 0 is the initial state; every other state was reached from
+        # parent_ids[id] by the move move_codes[id] (see encode_move).
+        state_ids: Dict[int, int] = {start_key: 0}
+        parent_ids = array('i', [-1])
+        move_codes = array('I', [0])
         
-        solution_found = False
-        final_numbers = None
+        # Children are checked for the target as they are generated, so only the start
+        # needs checking here. Each move only adds its result, so a child reaches the
+        # target exactly when its result is the target.
+        solution_found = target in initial_state.sorted_numbers
+        final_id = 0 if solution_found else None
+        expand_one = partial(expand_key, lane_bits=lane_bits, use_compiled=use_compiled)
+        pool = None
         
-        while queue:
-            cost, current_state = queue.popleft()
-            
-            # Check if target is reached
-            if target in current_state.numbers:
-                solution_found = True
-                final_numbers = tuple(sorted(current_state.numbers))
-                break
-
-            # Else check if we went too far.
-            if len(current_state.numbers) == 1:
-                continue
-            
-            # Generate neighbors
-            valid_moves = self.game.get_valid_moves(
-                current_state
-            )
-            for move in valid_moves:
-                # We don't actually need to rollback if we are doing BFS.
-                # If the path is unsuccessful, we just discard it.
-                if move.move_type != MoveType.OPERATION:
-                    continue
+        # Search one depth at a time, so a whole layer can be expanded at once.
+        # Visiting the keys of each layer in order is the same order a queue would give.
+        # Every state in a layer has the same count of numbers, one fewer per depth.
+        frontier = [] if solution_found else [start_key]
+        remaining = len(initial_state.sorted_numbers)
+        try:
+            # Stop once a layer is down to single numbers, as there's nothing left to combine
+            while frontier and remaining > 1:
+                # Small layers aren't worth the round trip to the workers
+                if self.processes is not None and len(frontier) >= self.PARALLEL_MIN_FRONTIER:
+                    if pool is None:
+                        pool = Pool(self.processes)
+                    layer_children = pool.map(expand_one, frontier, chunksize=64)
+                else:
+                    layer_children = map(expand_one, frontier)
                 
-                result = move.operation.apply(move.op1, move.op2)
-                new_numbers = current_state.numbers.copy()
-                new_numbers.remove(move.op1)
-                new_numbers.remove(move.op2)
-                new_numbers.append(result)
-                new_numbers_tuple = tuple(sorted(new_numbers))
+                # Merge in frontier order, so the first parent to reach a state keeps it.
+                # Frontier entries only hold keys; the parallel arrays hold the rest of the tree.
+                next_frontier = []
+                for current_key, children in zip(frontier, layer_children):
+                    current_id = state_ids[current_key]
+                    for new_key, move_code, result in children:
+                        new_id = state_ids.setdefault(new_key, len(parent_ids))
+                        if new_id == len(parent_ids):
+                            parent_ids.append(current_id)
+                            move_codes.append(move_code)
+                            if result == target:
+                                solution_found = True
+                                final_id = new_id
+                                break
+                            next_frontier.append(new_key)
+                    if solution_found:
+                        break
                 
-                if new_numbers_tuple not in came_from:
-                    came_from[new_numbers_tuple] = (
-                        tuple(sorted(current_state.numbers)), 
-                        f"{move} = {result}"
-                    )
-                    new_state = GameState(
-                        numbers=new_numbers, 
-                        move_history=(current_state.move_history or []) + [new_numbers],
-                        target=target
-                    )
-                    queue.append((cost + 1, new_state))
+                if solution_found:
+                    break
+                frontier = next_frontier
+                remaining -= 1
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
         
         if solution_found:
-            # Reconstruct path
-            path = []
-            curr = final_numbers
-            while curr != start_numbers:
-                print(f"Reconstructing step: {curr}")
-                parent, move_desc = came_from[curr]
-                state = GameState(
-                    numbers=list(curr), 
-                    move_description=move_desc, 
-                    target=target
-                )
-                path.append(state)
-                curr = parent
-            
-            # Add initial state
-            path.append(initial_state)
-            path.reverse()
-            return True, path
+            codes = path_codes(parent_ids, move_codes, final_id)
+            self._memo.remember(memo_key, codes)
+            return True, replay_codes(initial_state, codes)
         else:
-            print(f"No solution found using BFS. State: {initial_state}, Target: {target}")
+            self._memo.remember(memo_key, None)
+            if verbose:
+                print(f"No solution found using BFS. State: {initial_state}, Target: {target}")
             return False, None
+
+class BidirectionalBFSSolver(BaseSolver):
+    '''
+    Meets in the middle instead of searching whole states.
+
+    Any solution is an expression tree over some subset of the numbers, using one
+    operation fewer than the subset has numbers. Going forward, we build the values
+    each subset can make from the values of its two halves, smallest subsets first.
+    Going backward, for every split of a subset we ask which value the second half
+    would need for the result to be the target, and look it up instead of forming
+    every combination. The largest layer is therefore never built, and the first
+    subset with a hit gives the shortest solution, same as BFS.
+    '''
+    def __init__(
+        self, 
+        game: CountleEngine, 
+        *args, 
+        **kwargs
+    ):
+        super().__init__(
+            game, 
+            *args, 
+            **kwargs
+        )
+        self.game = game
+
+    @staticmethod
+    def _required_values(x: int, target: int) -> List[Tuple[int, int]]:
+        '''
+        Get the (operation index, y) pairs for which x op y could be the target.
+        Zero operands are handled by the caller, as they allow any y.
+        '''
+        candidates = [(0, target - x), (1, x - target)]
+        if x != 0 and target % x == 0:
+            candidates.append((2, target // x))
+        if target != 0 and x % target == 0:
+            candidates.append((3, x // target))
+        return candidates
+
+    def solve(
+        self, 
+        initial_state: GameState = None, 
+        verbose: bool = False
+    ) -> Tuple[bool, List[GameState]]:
+        if initial_state is None:
+            # Generate a new level if no state provided
+            if verbose:
+                print("No initial state provided, generating a new level.")
+            initial_state = self.game.reset()
+
+        target = initial_state.target
+        numbers = initial_state.numbers.tolist()
+        n = len(numbers)
+
+        if target in numbers:
+            return True, [initial_state]
+
+        # values[mask]: value -> how it was made from the numbers in mask, as
+        # (left_mask, left_value, operation index, right_mask, right_value), or None for a number
+        values: Dict[int, Dict[int, Optional[Tuple[int, int, int, int, int]]]] = {
+            1 << i: {} for i in range(n)
+        }
+        for i, x in enumerate(numbers):
+            values[1 << i][x] = None
+
+        masks_by_size: List[List[int]] = [[] for _ in range(n + 1)]
+        for mask in range(1, 1 << n):
+            masks_by_size[bin(mask).count("1")].append(mask)
+
+        for size in range(2, n + 1):
+            # Backward: look for a split of a subset that makes the target
+            for mask in masks_by_size[size]:
+                found = self._find_target(mask, values, target)
+                if found is not None:
+                    return True, self._build_path(initial_state, found, values)
+
+            if size == n:
+                break
+
+            # Forward: build the values of every subset of this size for the next layers
+            for mask in masks_by_size[size]:
+                made = {}
+                # Proper, nonempty submasks for the left half
+                left = (mask - 1) & mask
+                while left:
+                    right = mask ^ left
+                    for x in values[left]:
+                        for y in values[right]:
+                            for op_index, func in enumerate(OP_FUNCS):
+                                # Commutative operations were already tried with the halves swapped
+                                if left > right and (op_index == 0 or op_index == 2):
+                                    continue
+                                result = func(x, y)
+                                if result is not None and result not in made:
+                                    made[result] = (left, x, op_index, right, y)
+                    left = (left - 1) & mask
+                values[mask] = made
+
+        if verbose:
+            print(f"No solution found using bidirectional BFS. State: {initial_state}, Target: {target}")
+        return False, None
+
+    def _find_target(
+        self, 
+        mask: int, 
+        values: Dict[int, Dict[int, Optional[Tuple[int, int, int, int, int]]]], 
+        target: int
+    ) -> Optional[Tuple[int, int, int, int, int]]:
+        '''
+        Find a way to make the target from exactly the numbers in mask, as a
+        (left_mask, left_value, operation index, right_mask, right_value) split.
+        '''
+        left = (mask - 1) & mask
+        while left:
+            right = mask ^ left
+            right_values = values[right]
+            for x in values[left]:
+                for op_index, y in self._required_values(x, target):
+                    if y in right_values and OP_FUNCS[op_index](x, y) == target:
+                        return left, x, op_index, right, y
+                if target == 0 and x == 0:
+                    # 0 * y is 0 for any y
+                    for y in right_values:
+                        return left, x, 2, right, y
+            left = (left - 1) & mask
+        return None
+
+    def _build_path(
+        self, 
+        initial_state: GameState, 
+        split: Tuple[int, int, int, int, int], 
+        values: Dict[int, Dict[int, Optional[Tuple[int, int, int, int, int]]]]
+    ) -> List[GameState]:
+        '''
+        Turn the expression tree rooted at split into the sequence of states playing it.
+        '''
+        # Operations in an order where both operands exist by the time they are used
+        steps: List[Tuple[int, int, int, int]] = []
+
+        def visit(node: Tuple[int, int, int, int, int]) -> int:
+            left, x, op_index, right, y = node
+            for mask, value in ((left, x), (right, y)):
+                child = values[mask][value]
+                if child is not None:
+                    visit(child)
+            result = OP_FUNCS[op_index](x, y)
+            steps.append((x, op_index, y, result))
+            return result
+
+        visit(split)
+
+        target = initial_state.target
+        numbers = initial_state.numbers.tolist()
+        path = [initial_state]
+        history = initial_state.move_history
+        for x, op_index, y, result in steps:
+            numbers.remove(x)
+            numbers.remove(y)
+            numbers.append(result)
+            move_desc = f"{x} {OP_SYMBOLS[op_index]} {y} = {result}"
+            history = HistoryNode(history, move_desc)
+            path.append(GameState(
+                numbers=list(numbers), 
+                move_history=history, 
+                move_description=move_desc, 
+                target=target
+            ))
+        return path
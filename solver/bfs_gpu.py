@@ -0,0 +1,145 @@
+# Solver using BFS with whole layers expanded as arrays, on the GPU if CuPy is available
+from typing import List, Tuple
+
+import numpy as np
+
+from game.state import GameState, fits_int64, lane_bits_for
+from game.engine import CountleEngine
+from solver.base import BaseSolver
+from solver.bfs import BFSSolver
+from solver._kernels import ADD, SUBTRACT, MULTIPLY, DIVIDE, encode_move, replay_codes
+
+# cupy is an optional dependency, used like numba in game._kernels
+try:
+    import cupy
+    CUPY_AVAILABLE = True
+except ImportError:
+    cupy = None
+    CUPY_AVAILABLE = False
+
+class GPUBFSSolver(BaseSolver):
+    '''
+    BFS that expands a whole layer at once with array operations.
+
+    Each layer is an (N, m) int64 array of sorted rows, one per state, since every
+    state at the same depth has the same count of numbers. For each pair of columns
+    and operation, all N children are computed in one go; duplicates within the layer
+    are then dropped by sorting the rows. States at different depths can't be equal,
+    so nothing else needs deduplicating.
+
+    Large layers are expanded with CuPy when it is installed, everything else with NumPy.
+    Finds the same length of solution as BFSSolver, which is used instead when
+    reachable numbers might not fit in int64.
+    '''
+    # Layers smaller than this are expanded with NumPy even if CuPy is available
+    GPU_MIN_FRONTIER = 4096
+
+    def __init__(
+        self,
+        game: CountleEngine,
+        *args,
+        **kwargs
+    ):
+        super().__init__(
+            game,
+            *args,
+            **kwargs
+        )
+        self.game = game
+
+    def solve(
+        self,
+        initial_state: GameState = None,
+        verbose: bool = False
+    ) -> Tuple[bool, List[GameState]]:
+        if initial_state is None:
+            # Generate a new level if no state provided
+            if verbose:
+                print("No initial state provided, generating a new level.")
+            initial_state = self.game.reset()
+
+        target = initial_state.target
+        if not fits_int64(lane_bits_for(initial_state.sorted_numbers)):
+            return BFSSolver(self.game).solve(initial_state, verbose)
+
+        if target in initial_state.sorted_numbers:
+            return True, [initial_state]
+
+        frontier = np.array([initial_state.sorted_numbers], dtype=np.int64)
+        # Per depth: (parent row in the previous layer, move code) of every row in the layer
+        layers: List[Tuple[np.ndarray, np.ndarray]] = []
+
+        while frontier.shape[1] > 1 and len(frontier):
+            use_gpu = CUPY_AVAILABLE and len(frontier) >= self.GPU_MIN_FRONTIER
+            xp = cupy if use_gpu else np
+            children, parents, codes, results = self._expand_layer(xp.asarray(frontier), xp)
+
+            # Check if target is reached, at the first child that makes it
+            hits = xp.flatnonzero(results == target)
+            if len(hits):
+                hit = int(hits[0])
+                moves = [int(codes[hit])]
+                row = int(parents[hit])
+                for layer_parents, layer_codes in reversed(layers):
+                    moves.append(int(layer_codes[row]))
+                    row = int(layer_parents[row])
+                moves.reverse()
+                return True, replay_codes(initial_state, moves)
+
+            # Keep the first child of each distinct row. lexsort is stable, so the first
+            # row of each run of equal rows is the one generated first.
+            if len(children):
+                order = xp.lexsort(children.T[::-1])
+                sorted_rows = children[order]
+                first = xp.ones(len(order), dtype=bool)
+                first[1:] = xp.any(sorted_rows[1:] != sorted_rows[:-1], axis=1)
+                keep = xp.sort(order[first])
+                children, parents, codes = children[keep], parents[keep], codes[keep]
+
+            if use_gpu:
+                children, parents, codes = cupy.asnumpy(children), cupy.asnumpy(parents), cupy.asnumpy(codes)
+            layers.append((parents, codes))
+            frontier = children
+
+        if verbose:
+            print(f"No solution found using GPU BFS. State: {initial_state}, Target: {target}")
+        return False, None
+
+    @staticmethod
+    def _expand_layer(frontier, xp):
+        '''
+        Get every child of every row of frontier, using array module xp (numpy or cupy).
+
+        Returns:
+            (children, parents, codes, results): the sorted child rows, the row of frontier
+            each came from, its move code from encode_move, and the result of that move
+        '''
+        n, m = frontier.shape
+        rows = xp.arange(n)
+        children, parents, codes, results = [], [], [], []
+        for i in range(m):
+            a = frontier[:, i]
+            for j in range(i + 1, m):
+                b = frontier[:, j]
+                rest = frontier[:, [k for k in range(m) if k != i and k != j]]
+                # Commutative operations once per pair, the others both ways round
+                for x, y, op, result, valid in (
+                    (i, j, ADD, a + b, None),
+                    (i, j, MULTIPLY, a * b, None),
+                    (i, j, SUBTRACT, a - b, a >= b),
+                    (j, i, SUBTRACT, b - a, b >= a),
+                    (i, j, DIVIDE, a // xp.where(b == 0, 1, b), (b != 0) & (a % xp.where(b == 0, 1, b) == 0)),
+                    (j, i, DIVIDE, b // xp.where(a == 0, 1, a), (a != 0) & (b % xp.where(a == 0, 1, a) == 0)),
+                ):
+                    index = rows if valid is None else xp.flatnonzero(valid)
+                    child = xp.concatenate([rest[index], result[index, None]], axis=1)
+                    children.append(xp.sort(child, axis=1))
+                    parents.append(index)
+                    codes.append(xp.full(len(index), encode_move(x, y, op), dtype=np.int64))
+                    results.append(result[index])
+        return (
+            xp.concatenate(children),
+            xp.concatenate(parents),
+            xp.concatenate(codes),
+            xp.concatenate(results)
+        )
@@ -1,58 +1,87 @@
+from heapq import heapify, heappop
 from typing import List, Tuple
 
 from solver.base import BaseSolver
 from game.state import GameState
-from game.types import MoveType
 
 class GreedySolver(BaseSolver):
     '''
-    A simple greedy solver that selects the move which gets closest to the target at each step.
+    A simple greedy solver that keeps the moves which get closest to the target at each step.
+
+    Rather than committing to the single best move, it keeps a small beam of the
+    beam_width best states at each step, so one bad early move isn't fatal.
+    beam_width = 1 is plain greedy.
 
     This obviously sucks as a solver, but is still nontrivial and 
     illustrates how to extend the BaseSolver class.
     '''
-    def __init__(self, game, *args, **kwargs):
+    def __init__(self, game, *args, beam_width: int = 4, **kwargs):
         super().__init__(game, *args, **kwargs)
         self.game = game
+        self.beam_width = beam_width
     
-    def solve(self, initial_state: GameState = None) -> Tuple[bool, List[GameState]]:
+    def solve(self, initial_state: GameState = None, verbose: bool = False) -> Tuple[bool, List[GameState]]:
         if initial_state is None:
             # Generate a new level if no state provided
-            print("No initial state provided, generating a new level.")
+            if verbose:
+                print("No initial state provided, generating a new level.")
             initial_state = self.game.reset()
         
-        current_state = initial_state
-        solution_path = [current_state]
+        target = initial_state.target
+        # Beam entries: (State, Moves from initial_state)
+        beam = [(initial_state, [])]
+        solution_moves = [] if target in initial_state.numbers else None
+        # Transposition table of every multiset reached so far, across all steps
+        seen = {initial_state.sorted_numbers}
         
-        while current_state.target not in current_state.numbers:
-            valid_moves = self.game.get_valid_moves(current_state)
-            if not valid_moves:
-                print("No valid moves left, failed to reach target.")
-                return False, solution_path
-            
-            # Select the operation that gets closest to the target
-            best_move = None
-            best_distance = float('inf')
-            for move in valid_moves:
-                if not move.move_type == MoveType.OPERATION:
-                    continue
-                result = move.operation.apply(move.op1, move.op2)
-                new_state = current_state.numbers.copy()
-                new_state.remove(move.op1)
-                new_state.remove(move.op2)
-                new_state.append(result)
-                distance = abs(current_state.target - result)
-                if distance < best_distance:
-                    best_distance = distance
-                    best_move = move
+        while solution_moves is None:
+            # Candidates: (Distance to target, Order, Beam index, Move)
+            # The order breaks ties, so moves never get compared.
+            candidates = []
+            for index, (state, _) in enumerate(beam):
+                # Without rollbacks every valid move is an operation, so score them directly
+                op_moves = self.game.get_valid_moves(state, include_rollback = False)
+                candidates += [
+                    (abs(target - move.operation.apply(move.op1, move.op2)), len(candidates) + k, index, move)
+                    for k, move in enumerate(op_moves)
+                ]
             
-            if best_move is None:
-                print("No valid operation moves found, failed to reach target.")
+            if not candidates:
+                if verbose:
+                    print("No valid moves left, failed to reach target.")
                 return False, None
             
-            # current_state = self.game.apply_move(current_state, best_move)
-            current_state, _, _, _, _ = self.game.step(best_move)
+            # Take the operations that get closest to the target, best first,
+            # until the beam is full of states that haven't been seen before
+            heapify(candidates)
+            next_beam = []
+            while candidates and len(next_beam) < self.beam_width:
+                distance, _, index, move = heappop(candidates)
+                state, moves = beam[index]
+                if distance == 0:
+                    solution_moves = moves + [move]
+                    break
+
+                # Only build next states for the moves that were kept
+                numbers = state.numbers.tolist()
+                numbers.remove(move.op1)
+                numbers.remove(move.op2)
+                numbers.append(move.operation.apply(move.op1, move.op2))
+                next_state = GameState(numbers = numbers, target = target)
+                # Different moves can lead to the same numbers; skip to the next best
+                if next_state.sorted_numbers in seen:
+                    continue
+                seen.add(next_state.sorted_numbers)
+                next_beam.append((next_state, moves + [move]))
+            beam = next_beam
+        
+        # Play the chosen moves for real, so the game ends up solved
+        current_state = initial_state
+        solution_path = [current_state]
+        for move in solution_moves:
+            current_state, _, _, _, _ = self.game.step(move)
             solution_path.append(current_state)
-            print(f"Applied move: {best_move}, New numbers: {current_state.numbers}")
+            if verbose:
+                print(f"Applied move: {move}, New numbers: {current_state.numbers.tolist()}")
         
-        return True, solution_path
\ No newline at end of file
+        return True, solution_path
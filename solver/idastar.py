@@ -0,0 +1,100 @@
+# Solver using iterative deepening A* for Countle game
+from typing import List, Tuple, Optional
+
+from game.state import GameState, fits_int64, lane_bits_for
+from game._kernels import NUMBA_AVAILABLE
+from game.engine import CountleEngine
+from solver.base import BaseSolver
+from solver._kernels import child_numbers, encode_move, expand, replay_codes
+
+# Returned by _search once the target is reached
+FOUND = -1
+
+class IDAStarSolver(BaseSolver):
+    '''
+    Uses Iterative Deepening A* to solve the Countle game.
+
+    Repeated depth-first searches with a growing bound on f = g + h. Only the current
+    path is ever held in memory, unlike BFS and A* which keep every state they've seen.
+    In exchange, states reachable in several ways are searched again each time, and
+    every iteration repeats the work of the ones before it.
+    Uses the same heuristic as AStarSolver, so solutions are still the shortest.
+    '''
+    def __init__(
+        self, 
+        game: CountleEngine, 
+        *args, 
+        **kwargs
+    ):
+        super().__init__(
+            game, 
+            *args, 
+            **kwargs
+        )
+        self.game = game
+
+    def heuristic(self, numbers: List[int], target: int) -> int:
+        # Same lower bound as AStarSolver.heuristic.
+        return 0 if target in numbers else 1
+
+    def solve(
+        self, 
+        initial_state: GameState = None, 
+        verbose: bool = False
+    ) -> Tuple[bool, List[GameState]]:
+        if initial_state is None:
+            # Generate a new level if no state provided
+            if verbose:
+                print("No initial state provided, generating a new level.")
+            initial_state = self.game.reset()
+        
+        target = initial_state.target
+        numbers = list(initial_state.sorted_numbers)
+        use_compiled = NUMBA_AVAILABLE and fits_int64(lane_bits_for(numbers))
+
+        # Move codes of the current path; the only state kept between calls of _search
+        moves: List[int] = []
+        bound = self.heuristic(numbers, target)
+        while True:
+            result = self._search(numbers, 0, bound, target, moves, use_compiled)
+            if result == FOUND:
+                return True, replay_codes(initial_state, moves)
+            if result is None:
+                # Nothing was cut off by the bound, so the whole tree was searched
+                if verbose:
+                    print(f"No solution found using IDA*. State: {initial_state}, Target: {target}")
+                return False, None
+            bound = result
+
+    def _search(
+        self, 
+        numbers: List[int], 
+        g: int, 
+        bound: int, 
+        target: int, 
+        moves: List[int], 
+        use_compiled: bool
+    ) -> Optional[int]:
+        '''
+        Depth-first search below numbers, skipping states whose f exceeds bound.
+
+        Returns:
+            FOUND if the target was reached, with moves holding the path to it.
+            Otherwise the smallest f that exceeded bound, or None if none did.
+        '''
+        f = g + self.heuristic(numbers, target)
+        if f > bound:
+            return f
+        if target in numbers:
+            return FOUND
+
+        next_bound = None
+        for i, j, op_index, result in expand(numbers, use_compiled):
+            moves.append(encode_move(i, j, op_index))
+            found = self._search(child_numbers(numbers, i, j, result), g + 1, bound, target, moves, use_compiled)
+            if found == FOUND:
+                return FOUND
+            moves.pop()
+            if found is not None and (next_bound is None or found < next_bound):
+                next_bound = found
+        return next_bound
@@ -1,4 +1,5 @@
-from typing import List, Tuple
+import random
+from typing import List, Optional, Tuple
 
 from solver.base import BaseSolver
 from game.state import GameState
@@ -8,30 +9,32 @@ class RandomSolver(BaseSolver):
     Select a random valid move at each step until the target is reached.
     Not really useful outside of debugging.
     '''
-    def __init__(self, game, *args, **kwargs):
+    def __init__(self, game, *args, seed: Optional[int] = None, **kwargs):
         super().__init__(game, *args, **kwargs)
         self.game = game
+        # Bound once, so each step doesn't look it up through the module
+        self._choice = random.Random(seed).choice
     
-    def solve(self, initial_state: GameState = None) -> Tuple[bool, List[GameState]]:
+    def solve(self, initial_state: GameState = None, verbose: bool = False) -> Tuple[bool, List[GameState]]:
         if initial_state is None:
             # Generate a new level if no state provided
-            print("No initial state provided, generating a new level.")
-            numbers, target = self.game.reset()
-            initial_state = GameState(numbers=numbers, target=target)
+            if verbose:
+                print("No initial state provided, generating a new level.")
+            initial_state = self.game.reset()
         
+        # Moves are played for real, as in GreedySolver, so the game follows along
         current_state = initial_state
         solution_path = [current_state]
         
-        import random
-        
         while current_state.target not in current_state.numbers:
-            valid_moves = self.game.get_valid_moves(current_state)
+            valid_moves = self.game.get_valid_moves(current_state, include_rollback = False)
             if not valid_moves:
-                print("No valid moves left, failed to reach target.")
-                return False, solution_path
+                if verbose:
+                    print("No valid moves left, failed to reach target.")
+                return False, None
             
-            move = random.choice(valid_moves)
-            current_state = self.game.apply_move(current_state, move)
+            move = self._choice(valid_moves)
+            current_state, _, _, _, _ = self.game.step(move)
             solution_path.append(current_state)
         
         return True, solution_path
\ No newline at end of file